@@ -13,6 +13,33 @@
 # limitations under the License.
 """Parse flags and arguments for the application and expose them similar to absl.flags."""
 import argparse
+from typing import List, Set
+
+
+DEFAULT_DB = 'warbot.db'
+
+def _shard_ids(value: str) -> List[int]:
+    """Parse shard IDs like '0-3' or '0,2,5' into a sorted list without duplicates."""
+    ids: Set[int] = set()
+    for part in value.split(','):
+        first, _, last = part.partition('-')
+        start, end = int(first), int(last or first)
+        if end < start:
+            raise argparse.ArgumentTypeError(f'Shard range {part} is reversed.')
+        ids.update(range(start, end + 1))
+    if not ids:
+        raise argparse.ArgumentTypeError('No shard IDs given.')
+    return sorted(ids)
+
+
+def db_path(flags: argparse.Namespace) -> str:
+    """DB file to use, defaults to one per shard set so processes on a host don't share a DB."""
+    if flags.db:
+        return flags.db
+    if flags.shard_ids is None:
+        return DEFAULT_DB
+    ids = '_'.join(str(i) for i in flags.shard_ids)
+    return f'warbot.shard{ids}of{flags.shard_count}.db'
 
 
 def init() -> argparse.Namespace:
@@ -23,7 +50,47 @@ def init() -> argparse.Namespace:
     parser.add_argument(
             '--dry_run', default=True, type=bool, action=argparse.BooleanOptionalAction,
             help='Make no DB changes or Discord posts.')
-    parser.add_argument('--db', default='warbot.db', help='WarBot state data.')
+    parser.add_argument(
+            '--log_json', default=False, type=bool, action=argparse.BooleanOptionalAction,
+            help='Log JSON objects, one per line.')
+    parser.add_argument(
+            '--log_queue', default=True, type=bool, action=argparse.BooleanOptionalAction,
+            help='Format and write logs on a background thread.')
+    parser.add_argument(
+            '--log_rate', default=0.0, type=float,
+            help='Max INFO/DEBUG logs per second from each logging call, 0 for no limit.')
+    parser.add_argument(
+            '--log_burst', default=20, type=int,
+            help='Logs each logging call may emit at once before --log_rate applies.')
+    parser.add_argument(
+            '--record', default='', help='Record Warhorn results to this gzip file, replacing it.')
+    parser.add_argument(
+            '--replay', default='',
+            help=('Replay Warhorn results recorded with --record instead of connecting to Warhorn '
+                  'or Discord.'))
+    parser.add_argument(
+            '--replay_speed', default=1.0, type=float,
+            help='Replay speed relative to the recording, 0 replays as fast as possible.')
+    parser.add_argument(
+            '--db', default='',
+            help=(f'WarBot state data, defaults to {DEFAULT_DB}, or warbot.shard<IDS>of<COUNT>.db '
+                  'with --shard_ids. Must be given to replay with --no-dry_run.'))
     parser.add_argument('--config', default='warbot.conf', help='WarBot configuration file path.')
-    return parser.parse_args()
+    parser.add_argument(
+            '--shard_count', default=0, type=int,
+            help=('Total Discord gateway shards across all WarBot processes, 0 lets Discord '
+                  'decide. Each process only knows the games it posted, so changing this moves '
+                  'guilds to processes with no record of them and their upcoming games are '
+                  'posted again.'))
+    parser.add_argument(
+            '--shard_ids', default=None, type=_shard_ids,
+            help=("Shards this process runs, e.g. '0-3' or '0,2', defaults to all of them. "
+                  'Processes sharing a host need separate --db files, the default DB is per '
+                  'shard set.'))
+    flags = parser.parse_args()
+    if flags.shard_ids is not None and not flags.shard_count:
+        parser.error('--shard_ids requires --shard_count.')
+    if flags.shard_ids is not None and not all(0 <= i < flags.shard_count for i in flags.shard_ids):
+        parser.error('--shard_ids must be less than --shard_count.')
+    return flags
 
@@ -13,28 +13,137 @@
 # limitations under the License.
 """Load warbot configuration files."""
 
-from typing import Set
+import datetime
+import re
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Pattern, Set, Tuple, Union
 
 from ruamel.yaml import YAML
-from ruamel.yaml.comments import CommentedSeq
+from ruamel.yaml.comments import CommentedMap, CommentedSeq
+
+from warhorn_api import Game
+
+
+_DAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+def _parse_time(s: str) -> datetime.time:
+    hour, minute = s.strip().split(':')
+    return datetime.time(int(hour), int(minute))
+
+
+class GameFilter:
+    """Compiled channel filter rules, a game must pass every rule that is set.
+
+    Filters compare equal when their rules are the same, so channels with
+    identical rules can share one evaluation per game.
+
+    Args:
+        scenario: Regex, or list of regexes, one of which must be found in the game name
+            (case-insensitive).
+        days: Day, or list of days, of the week the game may start on, e.g. ['Sat', 'Sun'].
+        hours: Window the game start time must fall in, e.g. '17:00-23:00', may wrap past midnight.
+        horizon: Only pass games starting within this many days.
+
+    Raises:
+        ValueError: If a rule can't be parsed.
+    """
+
+    __slots__ = '_key', '_scenario', '_days', '_hours', '_horizon'
+
+    def __init__(
+            self,
+            scenario: Optional[Union[str, Iterable[str]]]=None,
+            days: Optional[Union[str, Iterable[str]]]=None,
+            hours: Optional[str]=None,
+            horizon: Optional[float]=None) -> None:
+        patterns = (scenario,) if isinstance(scenario, str) else tuple(scenario or ())
+        self._scenario: Tuple[Pattern[str], ...] = tuple(
+            re.compile(p, re.IGNORECASE) for p in patterns)
+        self._days: Optional[FrozenSet[int]] = None
+        if days is not None:
+            days = (days,) if isinstance(days, str) else days
+            try:
+                self._days = frozenset(_DAYS.index(str(d).strip().lower()[:3]) for d in days)
+            except ValueError as e:
+                raise ValueError(f'Unknown day in filter days: {days}') from e
+        self._hours: Optional[Tuple[datetime.time, datetime.time]] = None
+        if hours is not None:
+            start, end = str(hours).split('-')
+            self._hours = (_parse_time(start), _parse_time(end))
+        self._horizon: Optional[datetime.timedelta] = (
+            None if horizon is None else datetime.timedelta(days=float(horizon)))
+        self._key: Tuple[Any, ...] = (
+            tuple(sorted(patterns)), self._days, self._hours, self._horizon)
+
+    def __bool__(self) -> bool:
+        """False if the filter has no rules and passes every game."""
+        return self._key != ((), None, None, None)
+
+    def matches(self, game: Game, now: datetime.datetime) -> bool:
+        """Check a game against the filter.
+
+        Args:
+            game: Game to check, day and hour rules use the game's own timezone.
+            now: Current time (timezone aware) for the horizon rule.
+        """
+        if self._scenario and not any(p.search(game.name) for p in self._scenario):
+            return False
+        if self._days is not None and game.starts.weekday() not in self._days:
+            return False
+        if self._hours is not None:
+            start, end = self._hours
+            t = game.starts.time()
+            if not (start <= t <= end if start <= end else t >= start or t <= end):
+                return False
+        if self._horizon is not None and game.starts - now > self._horizon:
+            return False
+        return True
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, GameFilter) and self._key == other._key
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    def __repr__(self) -> str:
+        return f'config.GameFilter{self._key}'
 
 
 class ChannelConfig:  # pylint: disable=too-few-public-methods
     """Discord channel configuration data."""
 
-    __slots__ = 'guild_id', 'channel_id'
+    __slots__ = 'guild_id', 'channel_id', 'digest_interval', 'filter'
 
-    def __init__(self, guild_id: str, channel_id: str):
+    def __init__(
+            self, guild_id: str, channel_id: str, digest_interval: float=0.0,
+            filter: Optional[CommentedMap]=None):  # pylint: disable=redefined-builtin
         self.guild_id: int = int(guild_id)
         """Discord Guild ID."""
         self.channel_id: int = int(channel_id)
         """Discord Channel ID."""
+        self.digest_interval: float = float(digest_interval)
+        """Seconds to gather new games into one digest post, 0 posts each game immediately."""
+        self.filter: GameFilter = GameFilter(**(filter or {}))
+        """Rules a game must pass to be posted to this channel."""
+
+    def _key(self) -> Tuple[int, int, float, GameFilter]:
+        return self.guild_id, self.channel_id, self.digest_interval, self.filter
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, ChannelConfig) and self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __repr__(self) -> str:
+        return (f'config.ChannelConfig(guild_id={self.guild_id}, channel_id={self.channel_id}, '
+                f'digest_interval={self.digest_interval}, filter={self.filter})')
 
 
 class VenueConfig:  # pylint: disable=too-few-public-methods
     """Game venue configuration data."""
 
-    __slots__ = 'name', 'slug', 'venue_embed', 'channel'
+    __slots__ = 'name', 'slug', 'venue_embed', '_channel', 'routes'
 
     def __init__(self, name: str, slug: str, venue_embed: str, channel: CommentedSeq):
         self.name: str = name
@@ -43,27 +152,90 @@ class VenueConfig:  # pylint: disable=too-few-public-methods
         """Warhorn slug, last part of the event page path. e.g. https://warhorn.net/events/SLUG"""
         self.venue_embed: str = venue_embed
         """Markdown string to for announcement, usually includes link to the store and maps."""
-        self.channel: Set[ChannelConfig] = {ChannelConfig(**c) for c in channel}  # type: ignore
+        self._channel: Set[ChannelConfig] = set()
+        self.routes: Dict[GameFilter, List[ChannelConfig]] = {}
+        """Channels grouped by their filter, so each filter is checked once per game."""
+        self.channel = {ChannelConfig(**c) for c in channel}  # type: ignore
+
+    @property
+    def channel(self) -> Set[ChannelConfig]:
         """Set of channels to post events to."""
+        return self._channel
+
+    @channel.setter
+    def channel(self, channel: Set[ChannelConfig]) -> None:
+        self._channel = channel
+        self.routes = {}
+        for ch in channel:
+            self.routes.setdefault(ch.filter, []).append(ch)
+
+    def __eq__(self, other: Any) -> bool:
+        return (isinstance(other, VenueConfig)
+                and (self.name, self.slug, self.venue_embed, self.channel)
+                == (other.name, other.slug, other.venue_embed, other.channel))
+
+    def __hash__(self) -> int:
+        return hash(self.slug)
 
     def __repr__(self) -> str:
         return f'config.VenueConfig(name="{self.name}", slug="{self.slug}", venue_embed="{self.venue_embed}", channel={self.channel})'
 
 
-class Config:  # pylint: disable=too-few-public-methods
+class Config:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
     """Top level WarBot config."""
 
-    __slots__ = 'discord_token', 'warhorn_token', 'poll_interval', 'venue'
+    __slots__ = (
+        'discord_token', 'warhorn_tokens', 'warhorn_budget', 'poll_interval', 'venue',
+        'ingest_host', 'ingest_port', 'ingest_debounce')
 
-    def __init__(self, discord_token: str, warhorn_token: str, poll_interval: float, venue: CommentedSeq) -> None:
+    def __init__(  # pylint: disable=too-many-arguments
+            self, discord_token: str, warhorn_token: Union[str, CommentedSeq], poll_interval: float,
+            venue: CommentedSeq, warhorn_budget: int=0, ingest_host: str='127.0.0.1',
+            ingest_port: Optional[int]=None, ingest_debounce: float=5.0) -> None:
         self.discord_token: str = discord_token
         """Discord API Token, see https://discord.com/developers/applications/."""
-        self.warhorn_token: str = warhorn_token
-        """Warhorn API Token, see https://warhorn.net/developers/docs/guides/access-tokens."""
+        self.warhorn_tokens: Tuple[str, ...] = (
+            (warhorn_token,) if isinstance(warhorn_token, str) else tuple(warhorn_token))
+        """Warhorn API Tokens, see https://warhorn.net/developers/docs/guides/access-tokens."""
+        self.warhorn_budget: int = warhorn_budget
+        """Requests each Warhorn token may make per minute, 0 for no limit."""
         self.poll_interval: float = poll_interval
         """Warhorn polling interval."""
         self.venue: Set[VenueConfig] = {VenueConfig(**v) for v in venue}  # type: ignore
         """Game Venue information."""
+        self.ingest_host: str = ingest_host
+        """Address the poll trigger endpoint listens on."""
+        self.ingest_port: Optional[int] = ingest_port
+        """Port for the poll trigger endpoint, None disables it."""
+        self.ingest_debounce: float = ingest_debounce
+        """Seconds to wait for more triggers before polling, repeated triggers are coalesced."""
+
+
+class ConfigDiff:  # pylint: disable=too-few-public-methods
+    """Venue changes between two configs, venues are matched by slug."""
+
+    __slots__ = 'added', 'removed', 'changed'
+
+    def __init__(self, old: Config, new: Config) -> None:
+        old_venues = {v.slug: v for v in old.venue}
+        new_venues = {v.slug: v for v in new.venue}
+        self.added: Set[VenueConfig] = {
+            v for slug, v in new_venues.items() if slug not in old_venues}
+        """Venues only in the new config."""
+        self.removed: Set[VenueConfig] = {
+            v for slug, v in old_venues.items() if slug not in new_venues}
+        """Venues only in the old config."""
+        self.changed: Set[VenueConfig] = {
+            v for slug, v in new_venues.items() if slug in old_venues and v != old_venues[slug]}
+        """New versions of venues whose embed or channels changed."""
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self) -> str:
+        return (f'config.ConfigDiff(added={sorted(v.slug for v in self.added)}, '
+                f'removed={sorted(v.slug for v in self.removed)}, '
+                f'changed={sorted(v.slug for v in self.changed)})')
 
 
 def load(config_file: str) -> Config:
@@ -0,0 +1,72 @@
+# Copyright 2021 Michael Olson
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local HTTP endpoint for triggering venue polls.
+
+External triggers, like a Warhorn webhook relay or a cron script, can
+`POST /poll/<slug>` to have WarBot poll a venue right away instead of waiting
+for the next polling interval.
+"""
+
+import logging
+from typing import Callable, Optional
+
+from aiohttp import web
+
+
+class IngestServer:
+    """Serves the poll trigger endpoint.
+
+    Args:
+        trigger: Called with the venue slug, returns False if the slug is unknown.
+        host: Address to listen on.
+        port: Port to listen on, 0 picks a free port.
+    """
+
+    __slots__ = '_trigger', '_host', '_port', '_runner'
+
+    def __init__(self, trigger: Callable[[str], bool], host: str='127.0.0.1', port: int=0) -> None:
+        self._trigger: Callable[[str], bool] = trigger
+        self._host: str = host
+        self._port: int = port
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def port(self) -> int:
+        """Port the server is listening on, resolved once started."""
+        return self._port
+
+    async def _handle_poll(self, request: web.Request) -> web.Response:
+        slug = request.match_info['slug']
+        if not self._trigger(slug):
+            logging.warning('Poll trigger for unknown venue: %s', slug)
+            return web.Response(status=404, text=f'Unknown venue: {slug}\n')
+        logging.debug('Poll trigger for venue: %s', slug)
+        return web.Response(status=202, text=f'Poll queued: {slug}\n')
+
+    async def start(self) -> None:
+        """Start listening for triggers."""
+        app = web.Application()
+        app.router.add_post('/poll/{slug}', self._handle_poll)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self._port)
+        await site.start()
+        self._port = self._runner.addresses[0][1]
+        logging.info('Poll trigger endpoint listening on %s:%d.', self._host, self._port)
+
+    async def stop(self) -> None:
+        """Stop listening for triggers."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -11,10 +11,21 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""Standard logging setup."""
+"""Standard logging setup.
+
+By default records are queued and a listener thread does the formatting and
+I/O, so logging never blocks the event loop on a slow stderr.
+"""
+import atexit
 from datetime import datetime
+import json
 import logging
+import logging.handlers
+import queue
 import sys
+import threading
+import time
+from typing import Dict, Tuple
 
 
 class LogFormatter(logging.Formatter):
@@ -24,13 +35,93 @@ class LogFormatter(logging.Formatter):
             datefmt or '%Y-%m-%d %H:%M:%S')  # type: ignore
 
 
-def init(level:int=logging.INFO):
-    """Setup root logger."""
-    handler = logging.StreamHandler(sys.stderr)
+class JsonFormatter(LogFormatter):
+    """Formats records as single line JSON objects."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'file': record.filename,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry)
+
+
+class RateLimitFilter(logging.Filter):  # pylint: disable=too-few-public-methods
+    """Token bucket rate limit for each logging call site, warnings and above are never dropped.
+
+    Args:
+        rate: Records per second allowed from each call site.
+        burst: Records a call site may log at once before being limited.
+    """
+    def __init__(self, rate: float, burst: int) -> None:
+        super().__init__()
+        self._rate: float = rate
+        self._burst: float = float(burst)
+        self._buckets: Dict[Tuple[str, str, int], Tuple[float, float, int]] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, dropped = self._buckets.get(key, (self._burst, now, 0))
+            tokens = min(self._burst, tokens + (now - last) * self._rate)
+            if tokens < 1.0:
+                self._buckets[key] = (tokens, now, dropped + 1)
+                return False
+            self._buckets[key] = (tokens - 1.0, now, 0)
+        if dropped:
+            record.msg = f'{record.msg} [{dropped} similar records dropped]'
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):  # pylint: disable=too-few-public-methods
+    """Queues records as is, leaving all formatting to the listener thread.
+
+    The stock QueueHandler formats on the logging thread, which makes records
+    picklable and snapshots the message at call time. Skipping that keeps
+    logging cheap for the caller, at the cost that an object passed as a log
+    argument and changed before the listener gets to it logs its changed value.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def init(
+        level:int=logging.INFO, json_lines:bool=False, queued:bool=True,
+        rate:float=0.0, burst:int=20):
+    """Setup root logger.
+
+    Args:
+        level: Minimum level to log.
+        json_lines: Log JSON objects, one per line, instead of text.
+        queued: Format and write records on a listener thread.
+        rate: Records per second allowed from each call site, 0 for no limit.
+        burst: Records a call site may log at once before rate limiting kicks in.
+    """
+    handler: logging.Handler = logging.StreamHandler(sys.stderr)
+    formatter = JsonFormatter if json_lines else LogFormatter
     handler.setFormatter(
-        LogFormatter(
+        formatter(
             fmt='%(levelname)s %(asctime)s %(filename)s:%(lineno)d - %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S.%f %Z(%z)'))
+    if queued:
+        log_queue: 'queue.SimpleQueue[logging.LogRecord]' = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, handler)
+        listener.start()
+        atexit.register(listener.stop)
+        handler = _QueueHandler(log_queue)  # type: ignore
+    if rate > 0:
+        handler.addFilter(RateLimitFilter(rate, burst))
     logging.basicConfig(
         level=level,
         handlers=[handler])
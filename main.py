@@ -20,6 +20,7 @@ an option if it gets enough users, but for now, if you want to ride on the
 authors service, file an issue against this project requesting it.
 """
 
+import asyncio
 import logging
 import sys
 
@@ -29,13 +30,13 @@ import args
 import config
 import logs
 from warbot import WarBot
-from warhorn_api import WarhornAPI
+from warhorn_api import ReplayWarhornAPI, WarhornAPI
 from warbot_db import WarBotDB
 
 
 def main(flags: Namespace) -> None:
     """Initialize and start WarBot."""
-    logging.info(f'Dry Run: {flags.dry_run}.')
+    logging.info('Dry Run: %s.', flags.dry_run)
     try:
         # Purely an asyncio speedup. Load and forget.
         import uvloop  # pylint: disable=import-outside-toplevel
@@ -45,19 +46,58 @@ def main(flags: Namespace) -> None:
         logging.info("uvloop not available.")
 
     conf = config.load(flags.config)
+    if flags.replay:
+        replay(flags, conf)
+        return
+    warhorn = WarhornAPI(
+        tokens=conf.warhorn_tokens, budget=conf.warhorn_budget, record_file=flags.record or None)
     bot = WarBot(
         conf,
-        WarBotDB(flags.db, dry_run=flags.dry_run),
-        WarhornAPI(token=conf.warhorn_token),
+        WarBotDB(args.db_path(flags), dry_run=flags.dry_run),
+        warhorn,
         dry_run=flags.dry_run,
-        debug=flags.debug)
+        debug=flags.debug,
+        config_file=flags.config,
+        shard_count=flags.shard_count or None,
+        shard_ids=flags.shard_ids)
     bot.run()
+    warhorn.close()
+
+
+def replay(flags: Namespace, conf: config.Config) -> None:
+    """Run the polling loop against recorded Warhorn results, without Discord.
+
+    Posts are always dry-run, DB writes follow --dry_run so they can be
+    profiled, but only to an explicitly given --db so replayed games never land
+    in the live DB.
+    """
+    if not flags.dry_run and not flags.db:
+        logging.fatal('Replay with --no-dry_run writes to the DB, pass a scratch --db for it.')
+        sys.exit(1)
+    logging.info('Replaying %s at %sx speed.', flags.replay, flags.replay_speed)
+    warhorn = ReplayWarhornAPI(flags.replay, speed=flags.replay_speed)
+    conf.poll_interval = 0.0  # The recording sets the pace.
+    bot = WarBot(
+        conf,
+        WarBotDB(args.db_path(flags), dry_run=flags.dry_run),
+        warhorn,
+        dry_run=True,
+        debug=flags.debug,
+        shard_count=flags.shard_count or None,
+        shard_ids=flags.shard_ids)
+    warhorn.keep_slugs(bot.polled_slugs)
+    asyncio.run(bot.polling_loop(until=lambda: warhorn.exhausted), debug=flags.debug)
 
 
 if __name__ == '__main__':
     flags = args.init()
-    logs.init(logging.DEBUG if flags.debug else logging.INFO)
-    logging.info(f'WarBot starting.')
+    logs.init(
+        logging.DEBUG if flags.debug else logging.INFO,
+        json_lines=flags.log_json,
+        queued=flags.log_queue,
+        rate=flags.log_rate,
+        burst=flags.log_burst)
+    logging.info('WarBot starting.')
     for i, arg in enumerate(sys.argv):
-        logging.info(f'arg[{i}]={arg}')
+        logging.info('arg[%d]=%s', i, arg)
     main(flags)
@@ -0,0 +1,78 @@
+# Copyright 2021 Michael Olson
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import datetime
+import unittest
+
+import config
+from unittest_utils import make_config, make_game, make_venue
+
+
+class ConfigDiffTest(unittest.TestCase):
+    def test_diff(self):
+        old = make_config(
+            make_venue('kept', ('1', '2')),
+            make_venue('removed', ('1', '2')),
+            make_venue('new-channel', ('1', '2')),
+            make_venue('new-embed', ('1', '2')))
+        new = make_config(
+            make_venue('kept', ('1', '2')),
+            make_venue('added', ('1', '2')),
+            make_venue('new-channel', ('1', '2'), ('3', '4')),
+            make_venue('new-embed', ('1', '2'), embed='Changed'))
+        diff = config.ConfigDiff(old, new)
+        self.assertEqual({'added'}, {v.slug for v in diff.added})
+        self.assertEqual({'removed'}, {v.slug for v in diff.removed})
+        self.assertEqual({'new-channel', 'new-embed'}, {v.slug for v in diff.changed})
+        self.assertFalse(config.ConfigDiff(old, old))
+
+
+class GameFilterTest(unittest.TestCase):
+    def test_matches(self):
+        now = datetime.datetime.fromisoformat('2021-12-20T00:00:00+00:00')
+        # Noon Saturday, Pacific time.
+        game = make_game('xxxx-yyy-zzzzzz', 'DDAL05-01 Treasure of the Broken Hoard', '2021-12-25T20:00:00+00:00')
+        self.assertFalse(config.GameFilter())
+        self.assertTrue(config.GameFilter().matches(game, now))
+        self.assertTrue(config.GameFilter(scenario='^ddal05').matches(game, now))
+        self.assertFalse(config.GameFilter(scenario=['^DDEP', 'CCC-']).matches(game, now))
+        self.assertTrue(config.GameFilter(days=['Saturday', 'sun']).matches(game, now))
+        self.assertFalse(config.GameFilter(days=['Fri']).matches(game, now))
+        # A single day may be a plain scalar in YAML.
+        self.assertTrue(config.GameFilter(days='Sat').matches(game, now))
+        self.assertFalse(config.GameFilter(days='Fri').matches(game, now))
+        self.assertTrue(config.GameFilter(hours='10:00-14:00').matches(game, now))
+        self.assertFalse(config.GameFilter(hours='17:00-23:00').matches(game, now))
+        self.assertTrue(config.GameFilter(hours='22:00-12:00').matches(game, now))
+        self.assertTrue(config.GameFilter(horizon=7).matches(game, now))
+        self.assertFalse(config.GameFilter(horizon=3).matches(game, now))
+
+    def test_bad_rules(self):
+        with self.assertRaises(ValueError):
+            config.GameFilter(days=['Caturday'])
+        with self.assertRaises(ValueError):
+            config.GameFilter(hours='noon')
+
+    def test_shared_routes(self):
+        venue = config.VenueConfig(**make_venue(
+            'test-event',
+            {'guild_id': '1', 'channel_id': '2', 'filter': {'days': ['Sat', 'Sun']}},
+            {'guild_id': '3', 'channel_id': '4', 'filter': {'days': ['sun', 'sat']}},
+            ('5', '6')))
+        self.assertEqual(2, len(venue.routes))
+        self.assertEqual(
+            [1, 3], sorted(ch.guild_id for ch in venue.routes[config.GameFilter(days=['Sat', 'Sun'])]))
+
+
+if __name__ == '__main__':
+    unittest.main()
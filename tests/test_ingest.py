@@ -0,0 +1,48 @@
+# Copyright 2021 Michael Olson
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import unittest
+
+import aiohttp
+
+from ingest import IngestServer
+
+
+class IngestServerTest(unittest.TestCase):
+    @staticmethod
+    async def _async_post(*slugs):
+        triggered = []
+        def trigger(slug):
+            triggered.append(slug)
+            return slug == 'test-event'
+        srv = IngestServer(trigger)
+        await srv.start()
+        try:
+            statuses = []
+            async with aiohttp.ClientSession() as session:
+                for slug in slugs:
+                    async with session.post(f'http://127.0.0.1:{srv.port}/poll/{slug}') as resp:
+                        statuses.append(resp.status)
+            return triggered, statuses
+        finally:
+            await srv.stop()
+
+    def test_trigger(self):
+        triggered, statuses = asyncio.run(self._async_post('test-event', 'nope'))
+        self.assertEqual(['test-event', 'nope'], triggered)
+        self.assertEqual([202, 404], statuses)
+
+
+if __name__ == '__main__':
+    unittest.main()
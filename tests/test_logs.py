@@ -0,0 +1,45 @@
+# Copyright 2021 Michael Olson
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import logging
+import unittest
+
+import logs
+
+
+def _record(msg, *args, level=logging.INFO, lineno=42):
+    return logging.LogRecord('test', level, '/src/warbot.py', lineno, msg, args, None)
+
+
+class LogsTest(unittest.TestCase):
+    def test_json_formatter(self):
+        formatter = logs.JsonFormatter(datefmt='%Y')
+        entry = json.loads(formatter.format(_record('Polling venue: %s', 'test-event')))
+        self.assertEqual('Polling venue: test-event', entry['message'])
+        self.assertEqual('INFO', entry['level'])
+        self.assertEqual('warbot.py', entry['file'])
+        self.assertEqual(42, entry['line'])
+
+    def test_rate_limit(self):
+        rate_limit = logs.RateLimitFilter(rate=0.001, burst=2)
+        self.assertEqual(
+            [True, True, False, False],
+            [rate_limit.filter(_record('Spam')) for _ in range(4)])
+        # Other call sites and warnings have their own budget.
+        self.assertTrue(rate_limit.filter(_record('Eggs', lineno=43)))
+        self.assertTrue(rate_limit.filter(_record('Spam', level=logging.WARNING)))
+
+
+if __name__ == '__main__':
+    unittest.main()
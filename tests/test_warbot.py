@@ -12,34 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import asyncio
+import gzip
+import json
+import os
 import unittest
 from unittest import mock
 
-import config
-import hikari
+from ingest import IngestServer
 from warbot import WarBot
-from warhorn_api import GraphNode, Game, WarhornAPI
+from warhorn_api import GraphNode, Game, ReplayWarhornAPI
 from warbot_db import WarBotDB
+from unittest_utils import FakeGateway, make_bot, make_config, make_game, make_venue
+
+
+test_dir = os.path.dirname(os.path.realpath(__file__))
 
 
 class WarBotTest(unittest.TestCase):
     def test_polling_loop(self):
-        chan = config.ChannelConfig(guild_id='8675', channel_id='309')
-        venue = config.VenueConfig(
-            name='Test Venue',
-            slug='test-event',
-            venue_embed='Brought to you by a unit test',
-            channel=tuple())  # type: ignore
-        venue.channel = {chan}
-        conf = config.Config(
-            token='',
-            poll_interval=0.0,
-            venue=tuple())  # type: ignore
-        conf.venue = {venue}
-
-        db = mock.create_autospec(WarBotDB)
-        db.add_notification.return_value = True
-
         game = Game(GraphNode({
             'uuid': 'xxxx-yyy-zzzzzz',
             'scenarioOffering': {
@@ -56,14 +46,7 @@ class WarBotTest(unittest.TestCase):
                 'timezone': 'US/Pacific',
             },
         }))
-        warhorn_api = mock.create_autospec(WarhornAPI)
-        warhorn_api.get_games.return_value.__aiter__.return_value = [game]
-        
-        bot = WarBot(conf, db, warhorn_api, dry_run=False, debug=False)
-        hikari_bot = mock.create_autospec(hikari.GatewayBot)
-        send = mock.AsyncMock()
-        hikari_bot.cache.get_guild_channel.return_value.send = send
-        bot._bot = hikari_bot  # pyright: reportPrivateUsage=false
+        bot, _, _, send = make_bot(make_config(make_venue()), [game])
 
         asyncio.run(bot.polling_loop(run_once=True))
 
@@ -73,6 +56,223 @@ class WarBotTest(unittest.TestCase):
         self.assertEqual('The Custom Game', embed.title)
         self.assertEqual('Brought to you by a unit test', embed.description)
 
+    def test_digest(self):
+        conf = make_config(make_venue(
+            'test-event', {'guild_id': '8675', 'channel_id': '309', 'digest_interval': 3600}))
+        games = [
+            make_game(f'uuid-{i:02}', f'Game {i:02}', f'2021-12-{25 - i % 20:02}T12:00:00.000000')
+            for i in range(30)]
+        bot, _, _, send = make_bot(conf, games)
+
+        asyncio.run(bot.polling_loop(run_once=True))
+
+        # 30 games fit in one message, split across two embeds.
+        send.assert_called_once()
+        embeds = send.call_args.kwargs['embeds']
+        self.assertEqual(['Test Venue', 'Test Venue (cont.)'], [e.title for e in embeds])
+        self.assertEqual([25, 5], [len(e.fields) for e in embeds])
+        starts = [g.starts for g in sorted(games, key=lambda g: g.starts)]
+        posted = {g.name: g.starts for g in games}
+        self.assertEqual(starts, [posted[f.name] for e in embeds for f in e.fields])
+
+    def test_digest_on_stopping(self):
+        conf = make_config(make_venue(
+            'test-event', {'guild_id': '8675', 'channel_id': '309', 'digest_interval': 3600}))
+        bot, db, _, send = make_bot(
+            conf, [make_game('uuid-1', 'DDAL05-01', '2021-12-25T20:00:00+00:00')])
+
+        async def poll_and_stop():
+            # Polled twice inside the digest window, the game is queued once and not yet recorded.
+            await bot._poll(conf.venue)  # pyright: reportPrivateUsage=false
+            await bot._poll(conf.venue)
+            db.add_notification.assert_not_called()
+            send.assert_not_called()
+            ingest = mock.create_autospec(IngestServer)
+            bot._ingest = ingest
+            await bot._on_stopping(mock.Mock())
+            ingest.stop.assert_awaited_once()
+
+        asyncio.run(poll_and_stop())
+
+        db.add_notification.assert_called_once_with('test-event', 8675, 309, 'uuid-1', 'DDAL05-01')
+        send.assert_called_once()
+        db.flush.assert_called_once()
+
+    def test_stopping_waits_for_poll(self):
+        bot, db, _, _ = make_bot(make_config())
+
+        async def stop_mid_poll():
+            # Holding the poll lock stands in for a poll in progress.
+            async with bot._poll_lock:  # pyright: reportPrivateUsage=false
+                stopping = asyncio.get_running_loop().create_task(bot._on_stopping(mock.Mock()))
+                await asyncio.sleep(0.01)
+                db.flush.assert_not_called()
+            await asyncio.wait_for(stopping, timeout=1)
+
+        asyncio.run(stop_mid_poll())
+        db.flush.assert_called_once()
+
+    def test_trigger_poll(self):
+        bot, db, warhorn_api, _ = make_bot(
+            make_config(make_venue(), ingest_debounce=0.01), dry_run=True)
+
+        async def trigger():
+            task = asyncio.get_running_loop().create_task(bot.trigger_loop())
+            self.assertTrue(bot.trigger_poll('test-event'))
+            self.assertTrue(bot.trigger_poll('test-event'))
+            self.assertFalse(bot.trigger_poll('unknown-event'))
+            await asyncio.sleep(0.1)
+            task.cancel()
+
+        asyncio.run(trigger())
+        # Repeated triggers within the debounce window poll once.
+        warhorn_api.get_games.assert_called_once_with('test-event')
+        db.save.assert_called_once()
+
+    def test_trigger_poll_error(self):
+        bot, _, warhorn_api, _ = make_bot(
+            make_config(make_venue(), ingest_debounce=0.01), dry_run=True)
+        warhorn_api.get_games.side_effect = ConnectionError('Warhorn is down')
+
+        async def trigger():
+            task = asyncio.get_running_loop().create_task(bot.trigger_loop())
+            for _ in range(2):
+                bot.trigger_poll('test-event')
+                await asyncio.sleep(0.1)
+            self.assertFalse(task.done())
+            task.cancel()
+
+        asyncio.run(trigger())
+        # The trigger loop survives the first failure and handles the second trigger.
+        self.assertEqual(2, warhorn_api.get_games.call_count)
+
+    def test_on_started_loads_db_first(self):
+        bot, db, warhorn_api, _ = make_bot(
+            make_config(make_venue(), poll_interval=60.0, ingest_debounce=0.0), dry_run=True)
+
+        async def start():
+            loaded = asyncio.Event()
+            async def load():
+                # A trigger arriving mid-load must not poll until the load is done.
+                bot.trigger_poll('test-event')
+                await asyncio.sleep(0.05)
+                warhorn_api.get_games.assert_not_called()
+                loaded.set()
+            db.load.side_effect = load
+            await bot._on_started(mock.Mock())  # pyright: reportPrivateUsage=false
+            self.assertTrue(loaded.is_set())
+            await asyncio.sleep(0.05)
+            for task in asyncio.all_tasks():
+                if task is not asyncio.current_task():
+                    task.cancel()
+
+        asyncio.run(start())
+        db.load.assert_awaited_once()
+        warhorn_api.get_games.assert_called()
+
+    def test_apply_config(self):
+        old = make_config(make_venue('kept'), make_venue('removed'), ingest_debounce=0.01)
+        new = make_config(make_venue('kept'), make_venue('added'), ingest_debounce=0.01)
+        bot, _, warhorn_api, _ = make_bot(old, dry_run=True)
+
+        async def apply():
+            task = asyncio.get_running_loop().create_task(bot.trigger_loop())
+            bot.apply_config(new)
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await bot.polling_loop(run_once=True)
+
+        asyncio.run(apply())
+        # Only the added venue is polled right away, then the next cycle skips the removed one.
+        self.assertEqual(
+            [mock.call('added'), mock.call('added'), mock.call('kept')],
+            sorted(warhorn_api.get_games.call_args_list))
+
+    def test_filtered_channels(self):
+        conf = make_config(make_venue(
+            'test-event',
+            {'guild_id': '1', 'channel_id': '2', 'filter': {'scenario': 'DDAL'}},
+            {'guild_id': '3', 'channel_id': '4', 'filter': {'scenario': 'DDEP'}}))
+        bot, db, _, _ = make_bot(
+            conf, [make_game('uuid-1', 'DDAL05-01', '2021-12-25T20:00:00+00:00')], dry_run=True)
+
+        asyncio.run(bot.polling_loop(run_once=True))
+
+        db.add_notification.assert_called_once_with('test-event', 1, 2, 'uuid-1', 'DDAL05-01')
+
+    def test_replay(self):
+        with open(os.path.join(test_dir, 'event_data.json')) as f:
+            result = json.load(f)['data']
+        record_file = os.path.join(test_dir, 'replay_test.jsonl.gz')
+        with gzip.open(record_file, 'wt') as f:
+            for t in (0.0, 0.02, 0.04):
+                f.write(json.dumps({'time': t, 'slug': 'test-event', 'result': result}) + '\n')
+        try:
+            warhorn_api = ReplayWarhornAPI(record_file, speed=2.0)
+        finally:
+            os.remove(record_file)
+
+        db = WarBotDB(os.path.join(test_dir, 'replay_test.db'), dry_run=True)
+        bot = WarBot(make_config(make_venue()), db, warhorn_api, dry_run=True, debug=False)
+
+        asyncio.run(bot.polling_loop(until=lambda: warhorn_api.exhausted))
+
+        self.assertTrue(warhorn_api.exhausted)
+        # The same published game was replayed three times, but is only new once.
+        self.assertEqual(1, len(db))
+
+    def test_replay_unpolled_venue(self):
+        with open(os.path.join(test_dir, 'event_data.json')) as f:
+            result = json.load(f)['data']
+        record_file = os.path.join(test_dir, 'replay_unpolled_test.jsonl.gz')
+        with gzip.open(record_file, 'wt') as f:
+            for slug in ('test-event', 'removed-event'):
+                f.write(json.dumps({'time': 0.0, 'slug': slug, 'result': result}) + '\n')
+        try:
+            warhorn_api = ReplayWarhornAPI(record_file, speed=0)
+        finally:
+            os.remove(record_file)
+
+        db = WarBotDB(os.path.join(test_dir, 'replay_unpolled_test.db'), dry_run=True)
+        bot = WarBot(make_config(make_venue()), db, warhorn_api, dry_run=True, debug=False)
+
+        # Results for venues that aren't polled would otherwise never be used up.
+        warhorn_api.keep_slugs(bot.polled_slugs)
+        asyncio.run(asyncio.wait_for(bot.polling_loop(until=lambda: warhorn_api.exhausted), 2))
+
+        self.assertTrue(warhorn_api.exhausted)
+
+    def test_sharding(self):
+        shard_0_guild, shard_1_guild = 2 << 22, 3 << 22
+        conf = make_config(
+            make_venue('test-event', (str(shard_0_guild), '2'), (str(shard_1_guild), '4')),
+            make_venue('other-event', (str(shard_0_guild), '2'), name='Other Venue'))
+
+        gateways = {}
+        for shard in (0, 1):
+            bot, _, warhorn_api, _ = make_bot(
+                conf, [make_game('uuid-1', 'DDAL05-01', '2021-12-25T20:00:00+00:00')],
+                shard_count=2, shard_ids=[shard])
+            gateway = FakeGateway({2: shard_0_guild, 4: shard_1_guild})
+            with mock.patch('hikari.GatewayBot', gateway):
+                bot.run()
+            self.assertEqual(([shard], 2), (gateway.shard_ids, gateway.shard_count))
+            # Posting to a channel the gateway doesn't serve would fail on the missing channel.
+            asyncio.run(bot.polling_loop(run_once=True))
+            gateways[shard] = (gateway, warhorn_api)
+
+        gateway_0, warhorn_0 = gateways[0]
+        gateway_1, warhorn_1 = gateways[1]
+        # Channel 2 gets a post for each of its venues.
+        self.assertEqual(2, len(gateway_0.channels[2].sent))
+        self.assertEqual(0, len(gateway_0.channels[4].sent))
+        self.assertEqual(0, len(gateway_1.channels[2].sent))
+        self.assertEqual(1, len(gateway_1.channels[4].sent))
+        # Only shard 0 has channels for other-event, so only it polls the venue.
+        self.assertEqual(
+            [mock.call('other-event'), mock.call('test-event')],
+            sorted(warhorn_0.get_games.call_args_list))
+        warhorn_1.get_games.assert_called_once_with('test-event')
 
 if __name__ == '__main__':
     unittest.main()
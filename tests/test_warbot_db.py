@@ -13,10 +13,9 @@
 # limitations under the License.
 import asyncio
 import os
+import time
 import unittest
 
-import testfixtures  # type: ignore
-
 import warbot_db
 
 
@@ -24,19 +23,68 @@ test_dir = os.path.dirname(os.path.realpath(__file__))
 
 
 class WarBotDB_Test(unittest.TestCase):
-    def test_anti_stomping(self):
-        test_db_file = os.path.join(test_dir, 'db_anti_stomp_test.db')
+    def _recover(self, db_text, tmp_text, tmp_newer=True):
+        test_db_file = os.path.join(test_dir, 'db_recover_test.db')
         test_tmp_db_file = test_db_file + '.saving'
-        with open(test_tmp_db_file, 'w'):
-            pass
-        with testfixtures.LogCapture() as lc:
+        for path, text in ((test_db_file, db_text), (test_tmp_db_file, tmp_text)):
+            if text is not None:
+                with open(path, 'w') as f:
+                    f.write(text)
+        if db_text is not None and tmp_text is not None:
+            os.utime(test_db_file if tmp_newer else test_tmp_db_file, (0, 0))
+        try:
+            db = warbot_db.WarBotDB(test_db_file, dry_run=False)
+            asyncio.run(db.load())
+            self.assertFalse(os.path.exists(test_tmp_db_file))
+            self.corrupt_kept = os.path.exists(test_db_file + '.corrupt')
+            return db
+        finally:
+            for path in (test_db_file, test_tmp_db_file, test_db_file + '.corrupt'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def test_recover_from_temp(self):
+        db = self._recover(
+            "{('test-event', (12345, 67890)): {'old': 'Old game.'}}",
+            "{('test-event', (12345, 67890)): {'old': 'Old game.', 'new': 'New game.'}}")
+        self.assertFalse(db.add_notification('test-event', 12345, 67890, 'new', 'New game.'))
+
+    def test_recover_corrupt_temp(self):
+        db = self._recover(
+            "{('test-event', (12345, 67890)): {'old': 'Old game.'}}",
+            "{('test-event', (12345, 67890)): {'old': 'Old g")
+        self.assertFalse(db.add_notification('test-event', 12345, 67890, 'old', 'Old game.'))
+        self.assertTrue(db.add_notification('test-event', 12345, 67890, 'new', 'New game.'))
+
+    def test_recover_corrupt_db(self):
+        db = self._recover(
+            "{('test-event', (12345, 67890)): {'old': 'Old g",
+            "{('test-event', (12345, 67890)): {'old': 'Old game.'}}",
+            tmp_newer=False)
+        self.assertFalse(db.add_notification('test-event', 12345, 67890, 'old', 'Old game.'))
+        self.assertTrue(self.corrupt_kept)
+
+    def test_corrupt_db_without_temp(self):
+        test_db_file = os.path.join(test_dir, 'db_corrupt_test.db')
+        with open(test_db_file, 'w') as f:
+            f.write("{('test-event', (12345, 67890)): {'old': 'Old g")
+        try:
+            db = warbot_db.WarBotDB(test_db_file, dry_run=False)
             with self.assertRaises(RuntimeError):
-                warbot_db.WarBotDB(test_db_file)
-            self.assertEqual(
-                'root CRITICAL\n'
-                '  Temp DB file "/home/olson/src/warbot/tests/db_anti_stomp_test.db.saving" '
-                'already exists. Manually recover or delete.', str(lc))
-        os.remove(test_tmp_db_file)
+                asyncio.run(db.load())
+            # The corrupt file is left alone for a human to recover.
+            with open(test_db_file) as f:
+                self.assertEqual("{('test-event', (12345, 67890)): {'old': 'Old g", f.read())
+        finally:
+            os.remove(test_db_file)
+
+    def test_recover_stale_temp(self):
+        db = self._recover(
+            "{('test-event', (12345, 67890)): {'new': 'New game.'}}",
+            "{('test-event', (12345, 67890)): {'old': 'Old game.'}}",
+            tmp_newer=False)
+        self.assertFalse(db.add_notification('test-event', 12345, 67890, 'new', 'New game.'))
+        self.assertTrue(db.add_notification('test-event', 12345, 67890, 'old', 'Old game.'))
 
     def test_load(self):
         test_db_file = os.path.join(test_dir, 'db_load_test.db')
@@ -52,13 +100,52 @@ class WarBotDB_Test(unittest.TestCase):
         self.assertEqual(0, len(db))
         self.assertTrue(db.add_notification('test-event', 12345, 67890, 'foo-bar-str', 'A very fun game.'))
         self.assertEqual(1, len(db))
-        asyncio.run(db.save())
+        asyncio.run(db.flush())
         self.assertTrue(os.path.exists(test_db_file))
+        self.assertFalse(os.path.exists(test_db_file + '.saving'))
         os.remove(test_db_file)
         # Save does nothing unless there are changes.
-        asyncio.run(db.save())
+        asyncio.run(db.flush())
         self.assertFalse(os.path.exists(test_db_file))
 
+    def test_group_commit(self):
+        test_db_file = os.path.join(test_dir, 'db_group_commit_test.db')
+        db = warbot_db.WarBotDB(test_db_file, dry_run=False, commit_changes=3, commit_interval=0.05)
+
+        async def save(*uuids):
+            for uuid in uuids:
+                db.add_notification('test-event', 12345, 67890, uuid, 'A very fun game.')
+            await db.save()
+            return os.path.exists(test_db_file)
+
+        async def committed(timeout=2.0):
+            # Wait for the commit timer and writer task rather than a fixed sleep.
+            deadline = time.monotonic() + timeout
+            while not os.path.exists(test_db_file) and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            if db._writer is not None:  # pyright: reportPrivateUsage=false
+                await asyncio.wait_for(db._writer, timeout=timeout)
+            return os.path.exists(test_db_file)
+
+        async def run():
+            try:
+                # Below both thresholds, nothing is written yet.
+                self.assertFalse(await save('a'))
+                # Enough pending changes commit right away.
+                await save('b')
+                self.assertIsNotNone(db._writer)
+                await asyncio.wait_for(db._writer, timeout=2.0)  # type: ignore
+                self.assertTrue(os.path.exists(test_db_file))
+                os.remove(test_db_file)
+                # Otherwise changes are committed once commit_interval passes.
+                self.assertFalse(await save('c'))
+                self.assertTrue(await committed())
+            finally:
+                if os.path.exists(test_db_file):
+                    os.remove(test_db_file)
+
+        asyncio.run(run())
+
     def test_add_notification(self):
         test_db_file = os.path.join(test_dir, 'db_load_test.db')
         db = warbot_db.WarBotDB(test_db_file, dry_run=True)
@@ -67,6 +154,9 @@ class WarBotDB_Test(unittest.TestCase):
         self.assertEqual(1, len(db))
         self.assertFalse(db.add_notification('test-event', 12345, 67890, 'foo-bar-str', 'A very fun game.'))
         self.assertEqual(1, len(db))
+        self.assertTrue(db.has_notification('test-event', 12345, 67890, 'foo-bar-str'))
+        self.assertFalse(db.has_notification('test-event', 12345, 67890, 'other-str'))
+        self.assertFalse(db.has_notification('other-event', 12345, 67890, 'foo-bar-str'))
 
 
 if __name__ == '__main__':
@@ -40,6 +40,28 @@ class MockWarhorn(BaseHTTPRequestHandler):
             shutil.copyfileobj(f, self.wfile)
 
 
+class ThrottlingWarhorn(MockWarhorn):
+    """Mock Warhorn that throttles the 'bad' token, reports 'spent' as out of budget, and records the tokens used."""
+    auth = []
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        if self.headers.get('Authorization') == 'Bearer spent':
+            self.send_header('RateLimit-Remaining', '0')
+            self.send_header('RateLimit-Reset', '60')
+
+    def do_POST(self):
+        auth = self.headers.get('Authorization', '')
+        ThrottlingWarhorn.auth.append(auth)
+        if auth == 'Bearer bad':
+            self.rfile.read(int(self.headers.get('Content-length', 0)))
+            self.send_response(HTTPStatus.TOO_MANY_REQUESTS)
+            self.send_header('Content-length', '0')
+            self.end_headers()
+            return
+        super().do_POST()
+
+
 class WarhornAPI_Test(unittest.TestCase):
     @staticmethod
     async def _async_query_games():
@@ -61,6 +83,68 @@ class WarhornAPI_Test(unittest.TestCase):
         self.assertEqual(game.status, 'PUBLISHED')
         self.assertEqual(game.url, 'https://warhorn.net/events/test-event/schedule/sessions/06df3e16-72fc-4752-8dce-3f04144c1247')
 
+    @staticmethod
+    async def _async_query_tokens(tokens, queries):
+        ThrottlingWarhorn.auth = []
+        with TestWebServer(ThrottlingWarhorn) as srv:
+            client = warhorn_api.WarhornAPI(url=f'http://localhost:{srv.port}', tokens=tokens)
+            for _ in range(queries):
+                games = [g async for g in client.get_games(
+                    'test-event',
+                    starts_after=datetime.fromisoformat('1997-08-29T02:14:00'))]
+                assert len(games) == 1
+        return ThrottlingWarhorn.auth
+
+    def test_token_rotation(self):
+        auth = asyncio.run(self._async_query_tokens(['one', 'two'], 3))
+        self.assertEqual(['Bearer one', 'Bearer two', 'Bearer one'], auth)
+
+    def test_throttled_token(self):
+        auth = asyncio.run(self._async_query_tokens(['bad', 'good'], 3))
+        # The throttled token is retried with the other, then benched.
+        self.assertEqual(['Bearer bad', 'Bearer good', 'Bearer good', 'Bearer good'], auth)
+
+    def test_spent_token(self):
+        auth = asyncio.run(self._async_query_tokens(['spent', 'good'], 3))
+        # Once Warhorn reports no budget left, the token is skipped until it resets.
+        self.assertEqual(['Bearer spent', 'Bearer good', 'Bearer good'], auth)
+
+    @staticmethod
+    async def _async_record(record_file):
+        with TestWebServer(MockWarhorn) as srv:
+            client = warhorn_api.WarhornAPI(url=f'http://localhost:{srv.port}', record_file=record_file)
+            for slug in ('test-event', 'other-event', 'test-event'):
+                _ = [g async for g in client.get_games(slug)]
+            client.close()
+
+    @staticmethod
+    async def _async_replay(record_file):
+        replay = warhorn_api.ReplayWarhornAPI(record_file, speed=0)
+        results = []
+        for slug in ('test-event', 'unknown-event', 'test-event', 'other-event', 'test-event'):
+            results.append((slug, [g.uuid async for g in replay.get_games(slug)]))
+        return results, replay.exhausted
+
+    def test_record_replay(self):
+        record_file = os.path.join(test_dir, 'record_test.jsonl.gz')
+        try:
+            # A second recording replaces the first, rather than appending to it.
+            asyncio.run(self._async_record(record_file))
+            asyncio.run(self._async_record(record_file))
+            results, exhausted = asyncio.run(self._async_replay(record_file))
+        finally:
+            if os.path.exists(record_file):
+                os.remove(record_file)
+        uuid = '06df3e16-72fc-4752-8dce-3f04144c1247'
+        self.assertEqual([
+            ('test-event', [uuid]),
+            ('unknown-event', []),
+            ('test-event', [uuid]),
+            ('other-event', [uuid]),
+            ('test-event', []),
+        ], results)
+        self.assertTrue(exhausted)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -15,7 +15,15 @@
 from http.server import BaseHTTPRequestHandler, HTTPServer
 import contextlib
 from threading import Thread
-from typing import Type
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Type, Union
+from unittest import mock
+
+import hikari
+
+from config import Config
+from warbot import WarBot
+from warbot_db import WarBotDB
+from warhorn_api import GraphNode, Game, WarhornAPI
 
 
 class TestWebServer(contextlib.AbstractContextManager):
@@ -37,3 +45,123 @@ class TestWebServer(contextlib.AbstractContextManager):
     def shutdown(self) -> None:
         self._server.shutdown()
         self._server.socket.close()
+
+
+def make_game(uuid: str, name: str, starts: str) -> Game:
+    """Build a published Game starting and ending at an ISO timestamp, in US/Pacific."""
+    return Game(GraphNode({
+        'uuid': uuid,
+        'scenario': {'name': name},
+        'signupUrl': f'https://wh/{uuid}/signup',
+        'status': 'PUBLISHED',
+        'slot': {
+            'startsAt': starts,
+            'endsAt': starts,
+            'timezone': 'US/Pacific',
+        },
+    }))
+
+
+def make_venue(
+        slug: str='test-event',
+        *channels: Union[Tuple[str, str], Dict[str, Any]],
+        name: str='Test Venue',
+        embed: str='Brought to you by a unit test') -> Dict[str, Any]:
+    """Build a venue's config mapping, as loaded from YAML.
+
+    Args:
+        slug: Warhorn event slug.
+        channels: (guild_id, channel_id) pairs or full channel mappings, default one channel.
+        name: Venue name.
+        embed: Venue embed text.
+    """
+    if not channels:
+        channels = (('8675', '309'),)
+    return {
+        'name': name,
+        'slug': slug,
+        'venue_embed': embed,
+        'channel': [
+            c if isinstance(c, dict) else {'guild_id': c[0], 'channel_id': c[1]} for c in channels],
+    }
+
+
+def make_config(*venues: Dict[str, Any], **kwargs: Any) -> Config:
+    """Build a Config with no tokens or poll interval, kwargs override any Config field."""
+    fields: Dict[str, Any] = {'discord_token': '', 'warhorn_token': '', 'poll_interval': 0.0}
+    fields.update(kwargs)
+    return Config(venue=venues, **fields)
+
+
+def make_bot(
+        conf: Config,
+        games: Iterable[Game]=(),
+        **kwargs: Any) -> Tuple[WarBot, mock.Mock, mock.Mock, mock.AsyncMock]:
+    """Build a WarBot on a mock DB, Warhorn API and Discord gateway.
+
+    The DB has no notifications yet, every poll returns games and every post is sent to one mock.
+
+    Args:
+        conf: Bot config.
+        games: Games returned for every venue.
+        kwargs: Passed on to WarBot, dry_run defaults to False.
+
+    Returns:
+        The bot, mock DB, mock Warhorn API and the mock every channel sends with.
+    """
+    db = mock.create_autospec(WarBotDB)
+    db.has_notification.return_value = False
+    db.add_notification.return_value = True
+    warhorn = mock.create_autospec(WarhornAPI)
+    warhorn.get_games.return_value.__aiter__.return_value = list(games)
+    kwargs.setdefault('dry_run', False)
+    kwargs.setdefault('debug', False)
+    bot = WarBot(conf, db, warhorn, **kwargs)
+    gateway = mock.create_autospec(hikari.GatewayBot)
+    send = mock.AsyncMock()
+    gateway.cache.get_guild_channel.return_value.send = send
+    bot._bot = gateway  # pyright: reportPrivateUsage=false
+    return bot, db, warhorn, send
+
+
+class FakeChannel:
+    """Guild channel that records what was sent to it."""
+    def __init__(self) -> None:
+        self.sent: List[Tuple[Tuple[Any, ...], Dict[str, Any]]] = []
+
+    async def send(self, *args: Any, **kwargs: Any) -> None:
+        self.sent.append((args, kwargs))
+
+
+class FakeGateway:
+    """Stand in for hikari.GatewayBot, its cache only holds channels of guilds on the shards it runs.
+
+    Args:
+        channels: Guild ID for every channel ID, across all shards.
+    """
+    def __init__(self, channels: Dict[int, int]) -> None:
+        self._guilds: Dict[int, int] = channels
+        self.channels: Dict[int, FakeChannel] = {c: FakeChannel() for c in channels}
+        self.shard_ids: Sequence[int] = ()
+        self.shard_count: int = 0
+        self.subscriptions: Dict[Any, Callable[..., Any]] = {}
+        self.cache = self
+        self.event_manager = self
+
+    def __call__(self, token: str) -> 'FakeGateway':
+        """Lets the instance stand in for the hikari.GatewayBot class."""
+        return self
+
+    def subscribe(self, event: Any, callback: Callable[..., Any]) -> None:
+        self.subscriptions[event] = callback
+
+    def run(self, shard_ids: Optional[Sequence[int]]=None, shard_count: Optional[int]=None, **_: Any) -> None:
+        """Connect the shards, but don't block."""
+        self.shard_count = shard_count or 1
+        self.shard_ids = shard_ids if shard_ids is not None else range(self.shard_count)
+
+    def get_guild_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        guild_id = self._guilds.get(channel_id)
+        if guild_id is None or (guild_id >> 22) % max(self.shard_count, 1) not in self.shard_ids:
+            return None
+        return self.channels[channel_id]
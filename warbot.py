@@ -14,53 +14,166 @@
 """WarBot hikari bot."""
 
 import asyncio
+import datetime
 import logging
-from typing import Optional
+import signal
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple, Union
 
 import hikari
-from hikari.events import StartedEvent
+from hikari.events import StartedEvent, StoppingEvent
 from gql.transport.exceptions import TransportServerError
 
-from config import Config, ChannelConfig, VenueConfig
-from warhorn_api import WarhornAPI, Game
+from config import Config, ChannelConfig, ConfigDiff, VenueConfig
+from config import load as load_config
+from ingest import IngestServer
+from warhorn_api import Game, ReplayWarhornAPI, WarhornAPI
 from warbot_db import WarBotDB
 
 
-class WarBot:  # pylint: disable=too-few-public-methods
+_EMBED_COLOR = hikari.Color(0x71368a)  # Purple
+# Discord message limits, see
+# https://discord.com/developers/docs/resources/channel#embed-object-embed-limits
+_EMBED_MAX_FIELDS = 25
+_MESSAGE_MAX_EMBEDS = 10
+_MESSAGE_MAX_CHARS = 6000
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    """Discord gateway shard that receives a guild's events."""
+    return (guild_id >> 22) % shard_count
+
+
+class _Digest:  # pylint: disable=too-few-public-methods
+    """New games gathered for a channel in digest mode, waiting to be posted."""
+
+    __slots__ = 'channel', 'due', 'games', 'queued'
+
+    def __init__(self, channel: ChannelConfig, due: float) -> None:
+        self.channel: ChannelConfig = channel
+        """Channel the digest will be posted to."""
+        self.due: float = due
+        """Event loop time after which the digest should be posted."""
+        self.games: List[Tuple[VenueConfig, Game]] = []
+        """Games gathered so far, and the venue they were posted for."""
+        self.queued: Set[Tuple[str, str]] = set()
+        """Venue slug and game UUID of each gathered game, so repeat polls don't add it twice."""
+
+
+def _digest_messages(games: List[Tuple[VenueConfig, Game]]) -> List[List[hikari.Embed]]:
+    """Group games by venue, sort by start time, and paginate into messages within Discord limits.
+
+    Args:
+        games: Venue and game pairs to include.
+
+    Returns:
+        List of messages, each a list of embeds.
+    """
+    by_venue: Dict[str, Tuple[VenueConfig, List[Game]]] = {}
+    for venue, game in games:
+        by_venue.setdefault(venue.slug, (venue, []))[1].append(game)
+    for _, venue_games in by_venue.values():
+        venue_games.sort(key=lambda g: g.starts)
+
+    messages: List[List[hikari.Embed]] = []
+    embeds: List[hikari.Embed] = []
+    chars = 0
+    for venue, venue_games in sorted(by_venue.values(), key=lambda v: v[1][0].starts):
+        embed: Optional[hikari.Embed] = None
+        for game in venue_games:
+            name, value = game.name, f'{game.time}\n{game.url}'
+            title = venue.name if embed is None else f'{venue.name} (cont.)'
+            header = len(title) + len(venue.venue_embed)
+            new_embed = embed is None or len(embed.fields) >= _EMBED_MAX_FIELDS
+            size = len(name) + len(value) + (header if new_embed else 0)
+            if embeds and (chars + size > _MESSAGE_MAX_CHARS
+                           or (new_embed and len(embeds) >= _MESSAGE_MAX_EMBEDS)):
+                messages.append(embeds)
+                embeds, chars = [], 0
+                if not new_embed:
+                    new_embed = True
+                    size += header
+            if new_embed or embed is None:
+                embed = hikari.Embed(title=title, description=venue.venue_embed, color=_EMBED_COLOR)
+                embeds.append(embed)
+            embed.add_field(name=name, value=value, inline=False)
+            chars += size
+    if embeds:
+        messages.append(embeds)
+    return messages
+
+
+class WarBot:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
     """WarBot initializes hikari, handles events, and runs the main bot loop.
 
     Args:
         config: Bot configuration.
         db: Database to store posted games.
         warhorn: Warhorn client to query for games.
+        config_file: Path config was loaded from, reloaded on SIGHUP.
+        shard_count: Total gateway shards across all WarBot processes, None lets Discord decide.
+        shard_ids: Shards run by this process, None for all of them. Only
+            channels in guilds on these shards are posted to by this process.
     """
 
-    __slots__ = '_bot', '_config', '_db', '_warhorn', '_dry_run', '_debug'
+    __slots__ = (
+        '_bot', '_config', '_config_file', '_db', '_warhorn', '_dry_run', '_debug', '_digests',
+        '_poll_lock', '_triggered', '_trigger_event', '_ingest', '_shard_count', '_shard_ids',
+        '_db_loaded')
 
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments
         self,
         config: Config,
         db: WarBotDB,
-        warhorn: WarhornAPI,
+        warhorn: Union[WarhornAPI, ReplayWarhornAPI],
         dry_run:bool=True,
-        debug:bool=True) -> None:
+        debug:bool=True,
+        config_file: Optional[str]=None,
+        shard_count: Optional[int]=None,
+        shard_ids: Optional[Sequence[int]]=None) -> None:
         self._bot: Optional[hikari.GatewayBot] = None
         self._config: Config = config
+        self._config_file: Optional[str] = config_file
         self._db: WarBotDB = db
         self._dry_run: bool = dry_run
         self._debug: bool = debug
-        self._warhorn: WarhornAPI = warhorn
-        logging.debug('Warhorn Token: %s', self._config.warhorn_token)
+        self._warhorn: Union[WarhornAPI, ReplayWarhornAPI] = warhorn
+        self._digests: Dict[Tuple[int, int], _Digest] = {}
+        self._poll_lock: asyncio.Lock = asyncio.Lock()
+        self._triggered: Set[str] = set()
+        self._trigger_event: asyncio.Event = asyncio.Event()
+        self._ingest: Optional[IngestServer] = None
+        self._db_loaded: bool = False
+        self._shard_count: Optional[int] = shard_count
+        self._shard_ids: Optional[FrozenSet[int]] = (
+            None if shard_ids is None else frozenset(shard_ids))
+        if self._shard_ids is not None and not self._shard_count:
+            raise ValueError('shard_ids requires shard_count.')
+        logging.debug('Warhorn Tokens: %s', self._config.warhorn_tokens)
         logging.debug('Discord Token: %s', self._config.discord_token)
 
+    def _owns(self, ch: ChannelConfig) -> bool:
+        """Check if the channel's guild is on a shard run by this process."""
+        if self._shard_ids is None or not self._shard_count:
+            return True
+        return shard_for_guild(ch.guild_id, self._shard_count) in self._shard_ids
+
+    def _polls(self, venue: VenueConfig) -> bool:
+        """Check if the venue has any channels this process posts to."""
+        return any(self._owns(ch) for ch in venue.channel)
+
+    @property
+    def polled_slugs(self) -> Set[str]:
+        """Slugs of the venues this process polls."""
+        return {venue.slug for venue in self._config.venue if self._polls(venue)}
+
     async def _post_game(self, ch: ChannelConfig, venue: VenueConfig, game: Game) -> None:
         """Construct the Discord announcement embed and post it."""
         logging.info(
-            f'Sending notice to {ch.guild_id}/{ch.channel_id} for "{game.name}".')
+            'Sending notice to %d/%d for "%s".', ch.guild_id, ch.channel_id, game.name)
         embed = hikari.Embed(
             title=game.name,
             description=venue.venue_embed,
-            color=hikari.Color(0x71368a),  # Purple
+            color=_EMBED_COLOR,
         )
         embed.add_field(name='Game Time', value=game.time, inline=False)
         embed.add_field(name='Sign up', value=game.url, inline=False)
@@ -69,34 +182,221 @@ class WarBot:  # pylint: disable=too-few-public-methods
             return
         await self._bot.cache.get_guild_channel(ch.channel_id).send(embed)  # type: ignore
 
-    async def polling_loop(self, run_once:bool=False) -> None:
-        """Periodically query Warhorn for new games."""
-        await self._db.load()
+    def _queue_digest(self, ch: ChannelConfig, venue: VenueConfig, game: Game) -> None:
+        """Hold a game for the channel's next digest, starting the digest window if needed."""
+        key = (ch.guild_id, ch.channel_id)
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = _Digest(ch, asyncio.get_running_loop().time() + ch.digest_interval)
+            self._digests[key] = digest
+        if (venue.slug, game.uuid) not in digest.queued:
+            digest.queued.add((venue.slug, game.uuid))
+            digest.games.append((venue, game))
+
+    async def _post_digest(self, digest: _Digest) -> None:
+        """Post the games gathered in a digest as few messages as Discord limits allow.
+
+        Games are only recorded in the DB here, so games still waiting in a
+        digest are found again by the next poll after a restart."""
+        ch = digest.channel
+        games = [
+            (venue, game) for venue, game in digest.games
+            if self._db.add_notification(
+                venue.slug, ch.guild_id, ch.channel_id, game.uuid, game.name)]
+        if not games:
+            return
+        messages = _digest_messages(games)
+        logging.info(
+            'Sending digest of %d games in %d messages to %d/%d.',
+            len(games), len(messages), ch.guild_id, ch.channel_id)
+        for embeds in messages:
+            if self._dry_run:
+                logging.info('Dry-Run, digest: %s', embeds)
+                continue
+            await self._bot.cache.get_guild_channel(ch.channel_id).send(embeds=embeds)  # type: ignore
+
+    async def _flush_digests(self, force: bool=False) -> None:
+        """Post digests whose window has elapsed.
+
+        Digests are only checked once per polling cycle, so a digest is posted
+        up to poll_interval after its window closes.
+
+        Args:
+            force: Post every pending digest regardless of its window.
+        """
+        now = asyncio.get_running_loop().time()
+        for key, digest in list(self._digests.items()):
+            if force or now >= digest.due:
+                del self._digests[key]
+                await self._post_digest(digest)
+
+    async def _poll_venue(self, venue: VenueConfig) -> None:
+        """Query Warhorn for one venue and announce any new games."""
+        logging.info('Polling venue: %s', venue.slug)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        async for game in self._warhorn.get_games(venue.slug):
+            for game_filter, channels in venue.routes.items():
+                if game_filter and not game_filter.matches(game, now):
+                    continue
+                for ch in channels:
+                    if not self._owns(ch):
+                        continue
+                    if ch.digest_interval > 0:
+                        if not self._db.has_notification(
+                                venue.slug, ch.guild_id, ch.channel_id, game.uuid):
+                            self._queue_digest(ch, venue, game)
+                    elif self._db.add_notification(
+                            venue.slug, ch.guild_id, ch.channel_id, game.uuid, game.name):
+                        await self._post_game(ch, venue, game)
+
+    async def _poll(self, venues: Iterable[VenueConfig], flush_digests: bool=False) -> None:
+        """Poll a set of venues, then post due digests and save the DB.
+
+        Polls are serialized so a triggered poll never interleaves with the
+        periodic one. Venues with no channels on this process's shards are
+        skipped.
+
+        Args:
+            venues: Venues to poll.
+            flush_digests: Post all pending digests, even if their window is still open.
+        """
+        async with self._poll_lock:
+            try:
+                for venue in venues:
+                    if self._polls(venue):
+                        await self._poll_venue(venue)
+            except TransportServerError:
+                logging.exception("Error getting games, try again later.")
+            await self._flush_digests(force=flush_digests)
+            await self._db.save()
+
+    def trigger_poll(self, slug: str) -> bool:
+        """Request an immediate poll of a venue, repeated requests are coalesced.
+
+        Args:
+            slug: Warhorn slug of the venue to poll.
+
+        Returns:
+            True if the venue is configured and a poll was queued, otherwise False.
+        """
+        if not any(venue.slug == slug for venue in self._config.venue):
+            return False
+        self._triggered.add(slug)
+        self._trigger_event.set()
+        return True
+
+    async def trigger_loop(self) -> None:
+        """Poll venues requested via trigger_poll, waiting ingest_debounce to batch requests."""
+        while True:
+            await self._trigger_event.wait()
+            await asyncio.sleep(self._config.ingest_debounce)
+            self._trigger_event.clear()
+            slugs, self._triggered = self._triggered, set()
+            logging.info('Triggered poll for: %s', ', '.join(sorted(slugs)))
+            try:
+                await self._poll(venue for venue in self._config.venue if venue.slug in slugs)
+            except Exception:  # pylint: disable=broad-except
+                # Keep serving triggers, the next one may well succeed.
+                logging.exception('Triggered poll failed.')
+
+    def apply_config(self, new: Config) -> None:
+        """Switch to a new config, only touching the venues that changed.
+
+        In-flight polls and pending digests finish against the config they
+        started with. Added and changed venues are polled right away, removed
+        venues are simply no longer polled.
+
+        Args:
+            new: Config to switch to.
+        """
+        changes = ConfigDiff(self._config, new)
+        restart_attrs = (
+            'discord_token', 'warhorn_tokens', 'warhorn_budget', 'ingest_host', 'ingest_port')
+        for attr in restart_attrs:
+            if getattr(new, attr) != getattr(self._config, attr):
+                logging.warning('Config %s changed, restart WarBot to apply it.', attr)
+        logging.info('Applying config changes: %s', changes)
+        self._config = new
+        for venue in changes.added | changes.changed:
+            self.trigger_poll(venue.slug)
+
+    def reload_config(self) -> None:
+        """Reload the config file and apply any changes, keeps the current config on error."""
+        if self._config_file is None:
+            logging.warning('No config file to reload.')
+            return
+        logging.info('Reloading config from %s.', self._config_file)
+        try:
+            new = load_config(self._config_file)
+        except RuntimeError:
+            logging.exception('Config reload failed, keeping current config.')
+            return
+        self.apply_config(new)
+
+    async def _load_db(self) -> None:
+        """Load the DB once, before anything polls."""
+        async with self._poll_lock:
+            if not self._db_loaded:
+                await self._db.load()
+                self._db_loaded = True
+
+    async def polling_loop(
+            self, run_once:bool=False, until: Optional[Callable[[], bool]]=None) -> None:
+        """Periodically query Warhorn for new games.
+
+        Args:
+            run_once: Poll once, posting any pending digests.
+            until: Checked after each poll, once True pending digests and DB changes are flushed
+                and polling stops.
+        """
+        await self._load_db()
         logging.info('Staring Warhorn polling.')
         run_loop = True
         while run_loop:
             logging.info('Polling for new games.')
             run_loop = not run_once
-            try:
-                for venue in self._config.venue:
-                    logging.info('Polling venue: %s', venue.slug)
-                    async for game in self._warhorn.get_games(venue.slug):
-                        for ch in venue.channel:
-                            if self._db.add_notification(
-                                    venue.slug, ch.guild_id, ch.channel_id, game.uuid, game.name):
-                                await self._post_game(ch, venue, game)
-            except TransportServerError:
-                logging.exception("Error getting games, try again later.")
-            await self._db.save()
+            await self._poll(self._config.venue, flush_digests=run_once)
+            if until is not None and until():
+                await self._flush_digests(force=True)
+                await self._db.flush()
+                return
             await asyncio.sleep(self._config.poll_interval)
 
     async def _on_started(self, _: StartedEvent) -> None:
         """Launch background tasks (the polling loop) and the connection to discord is up."""
         logging.info("StartedEvent, we should be connected.")
-        asyncio.get_running_loop().create_task(self.polling_loop())
+        # Nothing may poll until the DB is loaded, or it would repost games.
+        await self._load_db()
+        loop = asyncio.get_running_loop()
+        loop.create_task(self.polling_loop())
+        loop.create_task(self.trigger_loop())
+        if hasattr(signal, 'SIGHUP'):
+            loop.add_signal_handler(signal.SIGHUP, self.reload_config)
+        if self._config.ingest_port is not None:
+            self._ingest = IngestServer(
+                self.trigger_poll, host=self._config.ingest_host, port=self._config.ingest_port)
+            await self._ingest.start()
+
+    async def _on_stopping(self, _: StoppingEvent) -> None:
+        """Stop the poll trigger endpoint, post pending digests and commit pending DB changes."""
+        logging.info("StoppingEvent, flushing digests and DB.")
+        if self._ingest is not None:
+            await self._ingest.stop()
+            self._ingest = None
+        # Wait out any poll in progress, so its digests and notifications are flushed too.
+        async with self._poll_lock:
+            await self._flush_digests(force=True)
+            await self._db.flush()
 
     def run(self) -> None:
         """Execute the main bot, does not return until terminated."""
         self._bot = hikari.GatewayBot(self._config.discord_token)
         self._bot.event_manager.subscribe(StartedEvent, self._on_started)
-        self._bot.run(asyncio_debug=self._debug)
+        self._bot.event_manager.subscribe(StoppingEvent, self._on_stopping)
+        shard_ids = self._shard_ids
+        if shard_ids is None and self._shard_count:
+            shard_ids = frozenset(range(self._shard_count))
+        self._bot.run(
+            asyncio_debug=self._debug,
+            shard_ids=None if shard_ids is None else sorted(shard_ids),
+            shard_count=self._shard_count or None)
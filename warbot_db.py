@@ -14,48 +14,105 @@
 """WarBot database storage."""
 
 import ast
+import asyncio
 import logging
 import os
-import pathlib
-import shutil
-from typing import Dict, Tuple
+import time
+from typing import Dict, List, Optional, Tuple
 
-from aiofile import async_open  # type: ignore
 from prettyprinter import pformat  # type: ignore
 
 
-class WarBotDB:
+_DB = Dict[Tuple[str, Tuple[int, int]], Dict[str, str]]
+
+
+def _read_db(path: str) -> Optional[_DB]:
+    """Read and parse a database file.
+
+    Returns:
+        The database, or None if the file doesn't exist.
+
+    Raises:
+        ValueError: If the file exists but can't be read or parsed.
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            db = ast.literal_eval(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, SyntaxError, ValueError, MemoryError, RecursionError) as e:
+        raise ValueError(f'DB file "{path}" could not be read.') from e
+    if not isinstance(db, dict):
+        raise ValueError(f'DB file "{path}" does not hold a dictionary.')
+    return db  # type: ignore
+
+
+def _write_db(path: str, tmp_path: str, db: _DB) -> None:
+    """Durably replace path with the formatted database, via fsync'd temp file and rename."""
+    text = pformat(db, indent=2, width=200, ribbon_width=200) + '\n'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if hasattr(os, 'O_DIRECTORY'):  # Directories can't be opened or fsync'd on Windows.
+        dir_fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class WarBotDB:  # pylint: disable=too-many-instance-attributes
     """WarBot Database, stores posted games as a text dictionary literal..
 
     This is slow as dirt compared to a real DB of nearly any kind, but it also
     seems sufficient for my purposes and is very light on the memory, which is
     good because I run this on an rpi cluster.
 
+    Changes are group committed by a background writer, formatting and file IO
+    happen off the event loop.
+
     Args:
         db_file: path to database file
-    
-    Raises:
-        RuntimeError: When there's danger of overwritting previous run data.
+        dry_run: Make no changes to the database file.
+        commit_changes: Commit as soon as this many changes are pending.
+        commit_interval: Seconds changes may wait for more changes before being committed.
     """
 
-    __slots__ = '_db_file', '_tmp_db_file', '_db', '_changed', '_dry_run'
+    __slots__ = (
+        '_db_file', '_tmp_db_file', '_db', '_changed', '_dry_run',
+        '_commit_changes', '_commit_interval', '_pending', '_first_change', '_timer', '_writer')
 
-    def __init__(self, db_file: str, dry_run:bool=True) -> None:
+    def __init__(
+            self, db_file: str, dry_run:bool=True,
+            commit_changes: int=20, commit_interval: float=60.0) -> None:
         self._db_file: str = db_file
         self._tmp_db_file: str = self._db_file + '.saving'
-        self._db: Dict[Tuple[str, Tuple[int, int]], Dict[str, str]] = {}
+        self._db: _DB = {}
         self._changed: bool = False
         self._dry_run: bool = dry_run
-        if os.path.exists(self._tmp_db_file):
-            # Do we really care this much? A couple repeat posts, let this stomp
-            # it, and we get on with our lives...
-            msg = f'Temp DB file "{self._tmp_db_file}" already exists. Manually recover or delete.'
-            logging.fatal(msg)
-            raise RuntimeError(msg)
+        self._commit_changes: int = commit_changes
+        self._commit_interval: float = commit_interval
+        self._pending: int = 0
+        self._first_change: float = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writer: Optional[asyncio.Task[None]] = None
 
     def __len__(self) -> int:
         return len(self._db)
 
+    def has_notification(self, slug: str, guild_id: int, channel_id: int, uuid: str) -> bool:
+        """Check if a notification is already in the database.
+
+        Args:
+            slug: Warhorn event slug.
+            guild_id: Discord guild ID being posted to.
+            channel_id: Discord channel ID being posted to.
+            uuid: Warhorn unique ID for the session.
+        """
+        return uuid in self._db.get((slug, (guild_id, channel_id)), {})
+
     def add_notification(  # pylint: disable=too-many-arguments
             self, slug: str, guild_id: int, channel_id: int, uuid: str, name: str) -> bool:
         """Add a notification to the database.
@@ -73,37 +130,116 @@ class WarBotDB:
         feed = (slug, (guild_id, channel_id))
         if feed not in self._db:
             self._db[feed] = {}
-            self._changed = True
+            self._mark_changed()
         if uuid not in self._db[feed]:
             self._db[feed][uuid] = name
-            self._changed = True
+            self._mark_changed()
             logging.info('New entry: %s (%s) -> %s', name, uuid, channel_id)
             return True
         return False
 
+    def _mark_changed(self) -> None:
+        if not self._changed:
+            self._first_change = time.monotonic()
+        self._changed = True
+        self._pending += 1
+
+    def _recover(self) -> _DB:
+        """Pick the newest valid of the DB file and a temp file left by an interrupted save.
+
+        Raises:
+            RuntimeError: If the DB file is corrupt and there's no valid temp file to recover from.
+        """
+        candidates: List[Tuple[float, str, _DB]] = []
+        corrupt: List[str] = []
+        for path in (self._db_file, self._tmp_db_file):
+            try:
+                db = _read_db(path)
+            except ValueError:
+                logging.exception('DB file %s is corrupt.', path)
+                corrupt.append(path)
+                continue
+            if db is not None:
+                candidates.append((os.path.getmtime(path), path, db))
+        if self._db_file in corrupt:
+            if not candidates:
+                # Starting empty would repost every game and overwrite the file.
+                msg = (f'DB file "{self._db_file}" is corrupt and there is no temp file to recover '
+                       'from. Manually recover or delete.')
+                logging.fatal(msg)
+                raise RuntimeError(msg)
+            if not self._dry_run:
+                logging.error('Keeping corrupt DB file as %s.corrupt.', self._db_file)
+                os.replace(self._db_file, self._db_file + '.corrupt')
+        if self._tmp_db_file in corrupt and not self._dry_run:
+            logging.warning('Removing corrupt temp DB file %s.', self._tmp_db_file)
+            os.remove(self._tmp_db_file)
+        if not candidates:
+            logging.warning('DB file %s does not exist.', self._db_file)
+            return {}
+        _, path, db = max(candidates, key=lambda c: c[0])
+        if os.path.exists(self._tmp_db_file) and not self._dry_run:
+            if path == self._tmp_db_file:
+                logging.warning('Recovering DB from temp file %s.', path)
+                os.replace(self._tmp_db_file, self._db_file)
+            else:
+                logging.warning('Removing stale temp DB file %s.', self._tmp_db_file)
+                os.remove(self._tmp_db_file)
+        return db
+
     async def load(self) -> None:
-        """Load the database from file."""
-        if os.path.exists(self._db_file):
-            async with async_open(self._db_file, 'r') as f:
-                self._db.update(ast.literal_eval(await f.read()))
-        else:
-            logging.warn('DB file %s does not exist.', self._db_file)
+        """Load the database from file, recovering from an interrupted save if needed."""
+        self._db.update(await asyncio.to_thread(self._recover))
         self._changed = False
+        self._pending = 0
 
-    async def save(self) -> None:
-        """Save the database to file if there are changes.
-
-        Writes to a temp file then renames it once the write is complete to
-        prevent corruption if interrupted mid write."""
-        if self._changed:
-            if self._dry_run:
-                logging.info(
-                        'Dry-Run, faking saving changes to DB to %s', self._db_file)
-                self._changed = False
-                return
+    def _start_commit(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.get_running_loop().create_task(self._commit())
+
+    async def _commit(self) -> None:
+        """Write snapshots of the database until no changes are left."""
+        while self._changed:
+            snapshot = {feed: dict(games) for feed, games in self._db.items()}
+            self._changed = False
+            self._pending = 0
             logging.debug('Saving DB to %s', self._db_file)
-            tmp_save = pathlib.Path(str(self._db_file) + '.saving')
-            async with async_open(tmp_save, 'w') as f:
-                await f.write(pformat(self._db, indent=2, width=200, ribbon_width=200) + '\n')
-            shutil.move(tmp_save, self._db_file)
+            try:
+                await asyncio.to_thread(_write_db, self._db_file, self._tmp_db_file, snapshot)
+            except OSError:
+                logging.exception('Saving DB to %s failed, will retry.', self._db_file)
+                self._mark_changed()
+                return
+
+    async def save(self) -> None:
+        """Schedule a commit if there are changes, without waiting for it.
+
+        Changes are committed once commit_changes of them are pending or the
+        oldest has waited commit_interval seconds. Writes go to a temp file
+        which is fsync'd and renamed over the DB file, so an interrupted save
+        never corrupts the DB."""
+        if not self._changed:
+            return
+        if self._dry_run:
+            logging.info(
+                    'Dry-Run, faking saving changes to DB to %s', self._db_file)
             self._changed = False
+            self._pending = 0
+            return
+        waited = time.monotonic() - self._first_change
+        if self._pending >= self._commit_changes or waited >= self._commit_interval:
+            self._start_commit()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self._commit_interval - waited, self._start_commit)
+
+    async def flush(self) -> None:
+        """Commit any pending changes now and wait for the write to finish."""
+        await self.save()
+        if self._changed and not self._dry_run:
+            self._start_commit()
+        if self._writer is not None:
+            await self._writer
@@ -13,15 +13,25 @@
 # limitations under the License.
 """Warhorn GraphQL client."""
 
+import asyncio
+import collections
 import collections.abc
 import datetime
+import gzip
+import json
 import logging
-from typing import AsyncGenerator, Dict, Optional, Sequence, Tuple, Union
+import threading
+import time
+from typing import (
+    Any, AsyncGenerator, Deque, Dict, Iterable, Iterator, Mapping, Optional, Sequence, Set, TextIO,
+    Tuple, Union)
 
+import aiohttp
 import pytz
 from gql import gql, Client
 from gql.transport.aiohttp import AIOHTTPTransport
 from gql.transport.aiohttp import log as gql_logger
+from gql.transport.exceptions import TransportServerError
 
 
 _QUERY = '''\
@@ -149,22 +159,199 @@ class Game:
         return f'Game("{self.name}", {self.time}, {self.status}, uuid: {self.uuid})'
 
 
+def _games(result: GraphNode) -> Iterator[Game]:
+    """Extract the published games from an eventSessions query result."""
+    for session in result.path('eventSessions', 'nodes').tuple:
+        status = session.path('status').str
+        if status not in ('PUBLISHED', 'DRAFT', 'CANCELED'):
+            logging.warn('Unexpected sessions status: %s', session)
+        if status != 'PUBLISHED':
+            continue
+        yield Game(session)
+
+
+def _header_float(headers: Mapping[str, str], *names: str) -> Optional[float]:
+    """Return the first of the named headers that holds a number."""
+    for name in names:
+        try:
+            return float(headers[name])
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+class _Token:  # pylint: disable=too-many-instance-attributes
+    """A Warhorn access token, its client, and what's known about its rate budget.
+
+    Args:
+        url: Warhorn GraphQL endpoint.
+        token: Access token, '' for unauthenticated access.
+        budget: Requests allowed per budget_period, 0 for no local limit.
+        budget_period: Seconds over which budget applies.
+    """
+
+    __slots__ = (
+        'name', 'transport', 'client', '_budget', '_budget_period', '_sent',
+        'remaining', 'reset_at', 'throttled_until', 'last_used', 'response_headers')
+
+    def __init__(self, url: str, token: str, budget: int, budget_period: float) -> None:
+        headers = {}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        self.name: str = f'...{token[-4:]}' if token else '(none)'
+        """Loggable token name."""
+        # Response headers are captured with a trace hook, as AIOHTTPTransport
+        # only keeps them in newer gql releases, and never for error responses.
+        trace = aiohttp.TraceConfig()
+        trace.on_request_end.append(self._on_request_end)
+        self.transport: AIOHTTPTransport = AIOHTTPTransport(
+            url=url, headers=headers, client_session_args={'trace_configs': [trace]})
+        self.client: Client = Client(transport=self.transport, fetch_schema_from_transport=False)
+        self._budget: int = budget
+        self._budget_period: float = budget_period
+        self._sent: Deque[float] = collections.deque()
+        self.remaining: Optional[float] = None
+        """Requests left before reset_at, as last reported by Warhorn."""
+        self.reset_at: float = 0.0
+        """Monotonic time Warhorn's reported budget resets."""
+        self.throttled_until: float = 0.0
+        """Monotonic time to wait until after being throttled."""
+        self.last_used: float = 0.0
+        """Monotonic time of the last request sent with this token."""
+        self.response_headers: Optional[Mapping[str, str]] = None
+        """Headers of the last response to this token."""
+
+    async def _on_request_end(
+            self, _session: aiohttp.ClientSession, _ctx: Any,
+            params: aiohttp.TraceRequestEndParams) -> None:
+        self.response_headers = params.response.headers
+
+    def ready_at(self, now: float) -> float:
+        """Monotonic time this token can next be used, now or earlier means ready."""
+        while self._sent and self._sent[0] <= now - self._budget_period:
+            self._sent.popleft()
+        ready = self.throttled_until
+        if self.remaining is not None and self.remaining < 1:
+            ready = max(ready, self.reset_at)
+        if self._budget and len(self._sent) >= self._budget:
+            ready = max(ready, self._sent[0] + self._budget_period)
+        return ready
+
+    def take(self, now: float) -> None:
+        """Record a request being sent with this token."""
+        self._sent.append(now)
+        self.last_used = now
+        if self.remaining is not None:
+            self.remaining -= 1
+
+    def update(self, headers: Optional[Mapping[str, str]]) -> None:
+        """Track the remaining budget from rate limit response headers, if Warhorn sent any."""
+        if not headers:
+            return
+        remaining = _header_float(headers, 'RateLimit-Remaining', 'X-RateLimit-Remaining')
+        if remaining is None:
+            return
+        self.remaining = remaining
+        reset = _header_float(headers, 'RateLimit-Reset', 'X-RateLimit-Reset')
+        if reset is not None:
+            if reset > 1e9:  # Epoch seconds rather than seconds from now.
+                reset -= time.time()
+            self.reset_at = time.monotonic() + reset
+
+    def throttle(self, backoff: float) -> float:
+        """Bench the token after Warhorn throttled it.
+
+        Args:
+            backoff: Seconds to bench the token for, unless Warhorn sent Retry-After.
+
+        Returns:
+            Seconds the token is benched for.
+        """
+        retry_after = _header_float(self.response_headers or {}, 'Retry-After')
+        if retry_after is not None:
+            backoff = retry_after
+        self.throttled_until = time.monotonic() + backoff
+        self.remaining = None
+        return backoff
+
+
 class WarhornAPI:  # pylint: disable=too-few-public-methods
-    """Warhorn client API."""
+    """Warhorn client API.
 
-    def __init__(self, url: str='https://warhorn.net/graphql', token: str='') -> None:
+    Requests are spread across all the given tokens, routing around tokens
+    that are out of budget or being throttled by Warhorn.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, url: str='https://warhorn.net/graphql', token: str='',
+            tokens: Iterable[str]=(), budget: int=0, budget_period: float=60.0,
+            throttle_backoff: float=60.0, record_file: Optional[str]=None) -> None:
         """Init Warhorn client.
 
         Args:
             url: Warhorn GraphQL endpoint.
+            token: Warhorn access token.
+            tokens: More Warhorn access tokens to spread requests across.
+            budget: Requests each token may make per budget_period, 0 for no local limit.
+            budget_period: Seconds over which budget applies.
+            throttle_backoff: Seconds to stop using a token after Warhorn throttles it, unless it
+                sends Retry-After.
+            record_file: Record raw query results to this gzip'd JSON lines file, for
+                ReplayWarhornAPI. Replaces any earlier recording, replay paces from the first
+                result in the file.
         """
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        self._transport = AIOHTTPTransport(url=url, headers=headers)
-        self._client = Client(transport=self._transport, fetch_schema_from_transport=False)
+        all_tokens = [t for t in (token, *tokens) if t] or ['']
+        self._tokens: Tuple[_Token, ...] = tuple(
+            _Token(url, t, budget, budget_period) for t in all_tokens)
+        self._throttle_backoff: float = throttle_backoff
+        self._record: Optional[TextIO] = None
+        self._record_lock: threading.Lock = threading.Lock()
+        if record_file:
+            self._record = gzip.open(record_file, 'wt', encoding='utf-8')  # type: ignore
         gql_logger.setLevel(logging.WARNING)  # type: ignore
 
+    async def _acquire(self, exclude: Set[_Token]) -> _Token:
+        """Wait for the least recently used token that is ready, ignoring excluded tokens."""
+        candidates = [t for t in self._tokens if t not in exclude]
+        while True:
+            now = time.monotonic()
+            ready_at = {t: t.ready_at(now) for t in candidates}
+            ready = [t for t in candidates if ready_at[t] <= now]
+            if ready:
+                token = min(ready, key=lambda t: t.last_used)
+                token.take(now)
+                return token
+            wait = min(ready_at.values()) - now
+            logging.warning('All Warhorn tokens are out of budget, waiting %.1fs.', wait)
+            await asyncio.sleep(wait)
+
+    async def _execute(self, query: Any) -> Any:
+        """Execute a query, retrying with another token if Warhorn throttles the one used."""
+        tried: Set[_Token] = set()
+        while True:
+            token = await self._acquire(tried)
+            try:
+                result = await token.client.execute_async(query)  # type: ignore
+            except TransportServerError as e:
+                if e.code != 429:
+                    raise
+                backoff = token.throttle(self._throttle_backoff)
+                tried.add(token)
+                logging.warning(
+                    'Warhorn throttled token %s, benching it for %.0fs.', token.name, backoff)
+                if len(tried) == len(self._tokens):
+                    raise
+                continue
+            token.update(token.response_headers)
+            return result
+
+    def _write_record(self, record: Mapping[str, Any]) -> None:
+        """Append a result to the record file, runs off the event loop."""
+        with self._record_lock:
+            if self._record is not None:
+                self._record.write(json.dumps(record) + '\n')
+                self._record.flush()
+
     async def get_games(
             self, slug: str, starts_after: Optional[datetime.datetime]=None
             ) -> AsyncGenerator[Game, None]:
@@ -179,11 +366,94 @@ class WarhornAPI:  # pylint: disable=too-few-public-methods
         starts_after = starts_after if starts_after else datetime.datetime.now()
         q = _QUERY.format(slug=slug, startsAfter=starts_after.isoformat())
         query = gql(q)
-        result = GraphNode(await self._client.execute_async(query))  # type: ignore
-        for session in result.path('eventSessions', 'nodes').tuple:
-            status = session.path('status').str
-            if status not in ('PUBLISHED', 'DRAFT', 'CANCELED'):
-                logging.warn('Unexpected sessions status: %s', session)
-            if status != 'PUBLISHED':
-                continue
-            yield Game(session)
+        result = await self._execute(query)
+        if self._record is not None:
+            await asyncio.to_thread(
+                self._write_record, {'time': time.time(), 'slug': slug, 'result': result})
+        for game in _games(GraphNode(result)):
+            yield game
+
+    def close(self) -> None:
+        """Close the record file, if recording."""
+        with self._record_lock:
+            if self._record is not None:
+                self._record.close()
+                self._record = None
+
+
+class ReplayWarhornAPI:
+    """Stand in for WarhornAPI that replays results recorded by it, without network access.
+
+    Each get_games call for a slug returns the next result recorded for that
+    slug, paced to the recorded timing.
+
+    Args:
+        record_file: File recorded with WarhornAPI(record_file=...).
+        speed: Replay speed relative to the recording, 0 replays as fast as possible.
+    """
+
+    __slots__ = '_records', '_speed', '_recorded_start', '_replay_start'
+
+    def __init__(self, record_file: str, speed: float=1.0) -> None:
+        self._records: Dict[str, Deque[Tuple[float, Any]]] = collections.defaultdict(
+            collections.deque)
+        self._speed: float = speed
+        self._recorded_start: float = 0.0
+        self._replay_start: Optional[float] = None
+        count = 0
+        with gzip.open(record_file, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    record = json.loads(line)
+                    if not count:
+                        self._recorded_start = record['time']
+                    self._records[record['slug']].append((record['time'], record['result']))
+                    count += 1
+            except (EOFError, json.JSONDecodeError):
+                logging.warning(
+                    'Recording %s is truncated, replaying the first %d results.',
+                    record_file, count)
+        logging.info(
+            'Loaded %d results for %d venues from %s.', count, len(self._records), record_file)
+
+    def keep_slugs(self, slugs: Set[str]) -> None:
+        """Drop recorded results for venues that won't be polled, so they can't hold off exhausted.
+
+        Args:
+            slugs: Venue slugs that will be polled.
+        """
+        for slug in sorted(set(self._records) - slugs):
+            logging.warning(
+                'Venue %s is not polled, skipping its %d recorded results.',
+                slug, len(self._records[slug]))
+            del self._records[slug]
+
+    @property
+    def exhausted(self) -> bool:
+        """True once every recorded result has been replayed."""
+        return not any(self._records.values())
+
+    async def get_games(
+            self, slug: str, starts_after: Optional[datetime.datetime]=None  # pylint: disable=unused-argument
+            ) -> AsyncGenerator[Game, None]:
+        """Replay the next recorded result for a venue.
+
+        Args:
+            slug: identifying string for the warhorn event.
+            starts_after: Ignored, results were filtered when recorded.
+        Returns:
+            Generator of games, empty once the venue's results are used up.
+        """
+        records = self._records.get(slug)
+        if not records:
+            return
+        recorded_at, result = records.popleft()
+        if self._speed > 0:
+            now = time.monotonic()
+            if self._replay_start is None:
+                self._replay_start = now
+            delay = (recorded_at - self._recorded_start) / self._speed - (now - self._replay_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        for game in _games(GraphNode(result)):
+            yield game